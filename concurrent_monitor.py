@@ -1,27 +1,63 @@
 #!/usr/bin/env python3
 import serial
 import cbor2
-import crcmod
-import time
+import logging
+import re
+import struct
 import threading
+import collections
+import multiprocessing
 import queue
 import sys
 import select
-from event_decoder import decode_result, format_event_list, decode_event_type_one_hot
 from data_storage import DeviceDataCollector
 
 # Configuration
 PORT = "/dev/tty.usbmodem11102"
 BAUDRATE = 9600
 
+# Logging (verbose per-packet dumps only at DEBUG level)
+logging.basicConfig(level=logging.INFO, format='%(message)s')
+log = logging.getLogger('monitor')
+
 # Protocol identifiers (4 bytes each, little endian)
 HEADER_START = bytes([0x0C, 0x0B, 0x0A, 0x09])
 HEADER_END = bytes([0x10, 0x0F, 0x0E, 0x0D])
 CHUNK_START = bytes([0x04, 0x03, 0x02, 0x01])
 CHUNK_END = bytes([0x08, 0x07, 0x06, 0x05])
 
-# CRC calculation
-calculate_crc = crcmod.predefined.mkPredefinedCrcFun('crc-32')
+# All four markers in one compiled pattern so the framer can scan the
+# whole buffer with a single C-level pass
+_MARKER_RE = re.compile(b'|'.join(
+    re.escape(m) for m in (CHUNK_START, CHUNK_END, HEADER_START, HEADER_END)))
+
+# Marker bytes -> small int, so dispatch is one hash lookup plus int
+# compares instead of up to four 4-byte equality checks
+_MK_CHUNK_START, _MK_CHUNK_END, _MK_HEADER_START, _MK_HEADER_END = range(4)
+_MARKER_KIND = {
+    CHUNK_START: _MK_CHUNK_START,
+    CHUNK_END: _MK_CHUNK_END,
+    HEADER_START: _MK_HEADER_START,
+    HEADER_END: _MK_HEADER_END,
+}
+
+# CRC calculation ('crc-32' == IEEE 802.3, same polynomial as zlib.crc32,
+# which runs in C and uses hardware CLMUL where available)
+from zlib import crc32 as calculate_crc
+
+# CBOR decoder, bound once so per-packet decodes skip the attribute lookup.
+# Prefer the C accelerator so decode never silently runs as Python bytecode.
+try:
+    from _cbor2 import loads as _cbor_loads
+except ImportError:
+    _cbor_loads = cbor2.loads
+    logging.getLogger('monitor').warning(
+        "C extension _cbor2 unavailable, falling back to pure-Python decoder")
+
+# Precompiled packet field layouts (little endian)
+_HEADER_LEN = struct.Struct('<H')    # [LENGTH]
+_CHUNK_HEAD = struct.Struct('<IH')   # [PACKET_ID][LENGTH]
+_PACKET_CRC = struct.Struct('<I')    # [CRC]
 
 # ACK protocol
 ACK_START = 0x191A1B1C
@@ -29,198 +65,244 @@ ACK_END = 0x1D1E1F20
 
 ACK_REQUESTED = 8
 
+# Reusable ACK frame: [ACK_START][CRC][ACK_END], only the CRC changes.
+# Only ever touched by the processor thread.
+_ACK_STRUCT = struct.Struct('<III')
+_ACK_BUF = bytearray(_ACK_STRUCT.size)
+
 def send_ack(ser, received_hash):
     """Send simple ACK with crc"""
     try:
-        ack_data = bytearray()
-        ack_data.extend(ACK_START.to_bytes(4, 'little'))
-        ack_data.extend(received_hash.to_bytes(4, 'little'))
-        ack_data.extend(ACK_END.to_bytes(4, 'little'))
-        
-        ser.write(ack_data)
-        print(f"ACK sent for crc: 0x{received_hash:08X}")
+        _ACK_STRUCT.pack_into(_ACK_BUF, 0, ACK_START, received_hash, ACK_END)
+        ser.write(_ACK_BUF)
+        log.info("ACK sent for crc: 0x%08X", received_hash)
     except Exception as e:
-        print(f"ACK send failed: {e}")
+        log.error("ACK send failed: %s", e)
 
-def parse_packet(hex_data, has_packet_id=False):
-    """Parse CBOR packet: [PACKET_ID?][LENGTH][CBOR][CRC]"""
+def _build_result(packet_id, cbor_view, received_hash):
+    """Verify CRC and decode CBOR payload into a result dict"""
+    # crc32 accepts any buffer, so the CRC runs straight on the
+    # memoryview; the payload is copied out exactly once below
+    calculated_hash = calculate_crc(cbor_view)
+    hash_valid = received_hash == calculated_hash
+    cbor_bytes = bytes(cbor_view)
+
+    # Decode CBOR
     try:
-        offset = 0
-        packet_id = -1
-        
-        if has_packet_id:
-            packet_id = int.from_bytes(bytes.fromhex(hex_data[:8]), "little")
-            offset = 4
-            
-        # Extract length (2 bytes, little endian)
-        length = int.from_bytes(bytes.fromhex(hex_data[offset*2:offset*2+4]), "little")
-        
-        # Extract CBOR data
-        cbor_start = offset*2 + 4
-        cbor_end = cbor_start + length * 2
-        cbor_hex = hex_data[cbor_start:cbor_end]
-        cbor_bytes = bytes.fromhex(cbor_hex)
-        
-        # Extract hash (4 bytes at end)
-        hash_hex = hex_data[cbor_end:cbor_end + 8]
-        received_hash = int.from_bytes(bytes.fromhex(hash_hex), "little")
-        
-        # Verify hash
-        calculated_hash = calculate_crc(cbor_bytes)
-        hash_valid = received_hash == calculated_hash
-        
-        # Decode CBOR
-        try:
-            decoded = cbor2.loads(cbor_bytes)
-        except:
-            decoded = {"error": "cbor decode failed"}
-        
-        return {
-            "ack_requested": decoded.get(ACK_REQUESTED, 0),
-            "packet_id": packet_id,
-            "data": decoded,
-            "hash_valid": hash_valid,
-            "received_hash": received_hash,
-            "calculated_hash": calculated_hash,
-            "raw_bytes": cbor_bytes
-        }
+        decoded = _cbor_loads(cbor_bytes)
+    except cbor2.CBORDecodeError:
+        decoded = {"error": "cbor decode failed"}
+
+    return {
+        "ack_requested": decoded.get(ACK_REQUESTED, 0),
+        "packet_id": packet_id,
+        "data": decoded,
+        "hash_valid": hash_valid,
+        "received_hash": received_hash,
+        "calculated_hash": calculated_hash,
+        "raw_bytes": cbor_bytes
+    }
+
+def parse_header_packet(pkt):
+    """Parse CBOR header packet: [LENGTH][CBOR][CRC]"""
+    try:
+        mv = memoryview(pkt)
+        # Length (2 bytes, little endian), then CBOR payload, then CRC (4 bytes)
+        (length,) = _HEADER_LEN.unpack_from(mv, 0)
+        (received_hash,) = _PACKET_CRC.unpack_from(mv, 2 + length)
+        return _build_result(-1, mv[2:2 + length], received_hash)
     except Exception as e:
         print(f"Parse packet error: {e}")
         return None
 
-def serial_reader(ser, data_queue, stop_event):
+def parse_chunk_packet(pkt):
+    """Parse CBOR chunk packet: [PACKET_ID][LENGTH][CBOR][CRC]"""
+    try:
+        mv = memoryview(pkt)
+        packet_id, length = _CHUNK_HEAD.unpack_from(mv, 0)
+        (received_hash,) = _PACKET_CRC.unpack_from(mv, 6 + length)
+        return _build_result(packet_id, mv[6:6 + length], received_hash)
+    except Exception as e:
+        print(f"Parse packet error: {e}")
+        return None
+
+def serial_reader(ser, data_queue, data_available, stop_event):
     print("Serial reader thread started")
-    
+
+    dropped = 0
+
     while not stop_event.is_set():
         try:
-            if ser.in_waiting:
-                new_data = ser.read(ser.in_waiting)
-                if new_data:
-                    data_queue.put(new_data)
-            else:
-                time.sleep(0.001)  # Very small delay when no data
-                
+            # Block on the first byte (or the serial timeout, so stop_event
+            # is still checked regularly), then drain whatever else has
+            # already arrived. read(size) would wait for the full size and
+            # batch input into timeout-sized windows, delaying every ACK.
+            data = ser.read(1)
+            if data:
+                waiting = ser.in_waiting
+                if waiting:
+                    data += ser.read(waiting)
+                # The bounded deque drops its oldest entry when full;
+                # count it so a stalled processor is visible instead of
+                # silently losing frames
+                if len(data_queue) == data_queue.maxlen:
+                    dropped += 1
+                    if dropped == 1 or dropped % 100 == 0:
+                        log.warning("Data queue full, oldest reads dropped (total: %d)", dropped)
+                # deque.append is atomic under the GIL - no lock needed
+                # for this single-producer/single-consumer pair
+                data_queue.append(data)
+                data_available.set()
+
         except Exception as e:
             print(f"Reader error: {e}")
             break
     
     print("Serial reader stopped")
 
-def packet_processor(ser, data_queue, stop_event, collector):
+def _visualize_worker(devices):
+    """Render matrices/plots from a device snapshot in a child process"""
+    collector = DeviceDataCollector()
+    collector.devices = devices
+    collector.visualize_matrices()
+
+def collector_worker(result_queue, stop_event, collector):
+    """Process 3: Aggregate parsed packets off the framing hot path"""
+    print("Collector worker thread started")
+
+    while not stop_event.is_set():
+        try:
+            kind, result = result_queue.get(timeout=0.1)
+        except queue.Empty:
+            continue
+
+        try:
+            if kind == 'header':
+                collector.process_header(result)
+            else:
+                collector.process_chunk(result)
+                # Check if collection is complete and export
+                collector.is_complete()
+        except Exception as e:
+            print(f"Collector error: {e}")
+
+    print("Collector worker stopped")
+
+def packet_processor(ser, data_queue, data_available, stop_event, result_queue):
     """Process 2: Process incoming data and handle protocol"""
     print("Packet processor thread started")
     
     buffer = bytearray()
     packet_data = bytearray()
-    debug_buffer = bytearray()
+    debug_tail = bytearray()
     receiving_header = False
     receiving_chunk = False
     
     while not stop_event.is_set():
         try:
-            # Get data from queue (non-blocking)
-            try:
-                new_data = data_queue.get_nowait()
-                
-                # Extract DEBUG messages
-                for byte in new_data:
-                    debug_buffer.append(byte)
-                    
-                    # Check if we have a complete line ending with \n
-                    if byte == ord('\n'):
-                        try:
-                            line_text = debug_buffer.decode('utf-8', errors='ignore').strip()
-                            # Only print if it starts with DEBUG:
-                            if line_text.startswith("DEBUG:"):
-                                print(f"{line_text}")
-                        except:
-                            pass
-                        debug_buffer.clear()  # Clear for next line
-                    
-                    # Prevent memory leak - clear if buffer gets too large
-                    elif len(debug_buffer) > 1000:
-                        debug_buffer.clear()
-                
-                # Add all data to binary protocol buffer (unmodified)
-                buffer.extend(new_data)
-                
-            except queue.Empty:
-                time.sleep(0.0001)
+            # Wait for the reader to signal data, then drain the deque
+            # (popleft is atomic under the GIL) into one batch
+            if not data_queue and not data_available.wait(timeout=0.1):
                 continue
-            
-            # Look for protocol markers (binary protocol handling)
-            while len(buffer) >= 4:
-                if buffer[:4] == HEADER_START:
-                    print("=== Header Start ===")
-                    receiving_header = True
-                    packet_data = bytearray()
-                    buffer = buffer[4:]
-                    
-                elif buffer[:4] == HEADER_END:
-                    print("=== Header End ===")
-                    receiving_header = False
-                    if packet_data:
-                        result = parse_packet(packet_data.hex(), has_packet_id=False)
-                        
-                        # Debug: Print CBOR structure with keys
-                        data = result.get('data', {})
-                        print(f"CBOR Header: Device Family {data.get(1)}, Total Chunks {data.get(2)}")
-                        print(f"📦 CBOR Header Data: {data}")
-                        
-                        # Process header in collector
-                        collector.process_header(result)
-                        
-                        if result.get('ack_requested', 1):    
-                            # Send ACK if hash is valid
-                            if result['hash_valid']:
-                                send_ack(ser, result['received_hash'])
-                            else:
-                                print("Hash invalid, no ACK sent")
-                        else:
-                            print("ACK not requested, no ACK sent")
-                    packet_data = bytearray()
-                    buffer = buffer[4:]
-                    
-                elif buffer[:4] == CHUNK_START:
+            data_available.clear()
+
+            chunks = []
+            while data_queue:
+                chunks.append(data_queue.popleft())
+            if not chunks:
+                continue
+
+            new_data = b''.join(chunks)
+
+            # Extract DEBUG messages (split complete lines in one C call)
+            *complete_lines, debug_tail = (debug_tail + new_data).split(b'\n')
+            for line in complete_lines:
+                if line.startswith(b'DEBUG:'):
+                    print(line.decode('utf-8', errors='ignore').strip())
+
+            # Prevent memory leak - clear if partial line gets too large
+            if len(debug_tail) > 1000:
+                debug_tail = bytearray()
+
+            # Add all data to binary protocol buffer (unmodified)
+            buffer.extend(new_data)
+
+
+            # Look for protocol markers: one compiled scan over the whole
+            # buffer, payload is whatever sits between the matches
+            last = 0
+            for m in _MARKER_RE.finditer(buffer):
+                if receiving_header or receiving_chunk:
+                    packet_data += buffer[last:m.start()]
+                last = m.end()
+                kind = _MARKER_KIND[m.group()]
+
+                # Chunk markers first: chunks vastly outnumber headers
+                if kind == _MK_CHUNK_START:
                     receiving_chunk = True
-                    packet_data = bytearray()
-                    buffer = buffer[4:]
-                    
-                elif buffer[:4] == CHUNK_END:
+                    del packet_data[:]
+
+                elif kind == _MK_CHUNK_END:
                     receiving_chunk = False
                     if packet_data:
-                        result = parse_packet(packet_data.hex(), has_packet_id=True)
+                        result = parse_chunk_packet(packet_data)
                         if result:
                             # Debug: Print CBOR structure with keys
                             data = result.get('data', {})
-                            print(f"Received Chunk {data.get(0)} (Packet ID: {result['packet_id']})")
-                            print(f"CBOR Data: {data}")
-                            
-                            # Process chunk in collector
-                            collector.process_chunk(result)
-                            
-                            # Check if collection is complete and export CBOR
-                            collector.is_complete()
-                            
+                            log.debug("Received Chunk %s (Packet ID: %d): %s", data.get(0), result['packet_id'], data)
+
+                            # Hand off to the collector worker so framing
+                            # never stalls on aggregation or disk I/O
+                            result_queue.put(('chunk', result))
+
                             if result.get('ack_requested', 1):
                                 # Send ACK if hash is valid
                                 if result['hash_valid']:
                                     send_ack(ser, result['received_hash'])
                                 else:
-                                    print("Hash invalid, no ACK sent")
+                                    log.warning("Hash invalid, no ACK sent")
                             else:
-                                print("ACK not requested, no ACK sent")
-                    packet_data = bytearray()
-                    buffer = buffer[4:]
-                    
-                elif receiving_header or receiving_chunk:
-                    # Collect packet data
-                    packet_data.append(buffer[0])
-                    buffer = buffer[1:]
-                else:
-                    # Skip unknown byte
-                    buffer = buffer[1:]
-                    
+                                log.debug("ACK not requested, no ACK sent")
+                    del packet_data[:]
+
+                elif kind == _MK_HEADER_START:
+                    log.info("=== Header Start ===")
+                    receiving_header = True
+                    del packet_data[:]
+
+                else:  # HEADER_END
+                    log.info("=== Header End ===")
+                    receiving_header = False
+                    if packet_data:
+                        result = parse_header_packet(packet_data)
+
+                        # Debug: Print CBOR structure with keys
+                        data = result.get('data', {})
+                        log.info("CBOR Header: Device Family %s, Total Chunks %s", data.get(1), data.get(2))
+                        log.debug("📦 CBOR Header Data: %s", data)
+
+                        # Hand off to the collector worker
+                        result_queue.put(('header', result))
+
+                        if result.get('ack_requested', 1):
+                            # Send ACK if hash is valid
+                            if result['hash_valid']:
+                                send_ack(ser, result['received_hash'])
+                            else:
+                                log.warning("Hash invalid, no ACK sent")
+                        else:
+                            log.debug("ACK not requested, no ACK sent")
+                    del packet_data[:]
+
+            # Consume the scanned region, holding back 3 bytes in case a
+            # marker is split across reads; open-frame payload is kept,
+            # anything between frames is noise and dropped
+            keep = max(last, len(buffer) - 3)
+            if (receiving_header or receiving_chunk) and keep > last:
+                packet_data += buffer[last:keep]
+            del buffer[:keep]
+
+
         except Exception as e:
             print(f"Processor error: {e}")
     
@@ -249,14 +331,16 @@ def offline_mode(filename):
     else:
         print("Failed to load data.")
 
-def monitor_serial():
+def monitor_serial(port=PORT, baudrate=BAUDRATE):
     """Concurrent serial monitor with two threads"""
-    print(f"Opening {PORT} at {BAUDRATE} baud...")
-    
+    print(f"Opening {port} at {baudrate} baud...")
+
     collector = DeviceDataCollector()
-    
-    with serial.Serial(PORT, BAUDRATE, timeout=1) as ser:
-        data_queue = queue.Queue(maxsize=1000)
+
+    with serial.Serial(port, baudrate, timeout=1) as ser:
+        data_queue = collections.deque(maxlen=1000)
+        data_available = threading.Event()
+        result_queue = queue.Queue()
         stop_event = threading.Event()
         
         print("Starting concurrent monitoring...")
@@ -264,21 +348,29 @@ def monitor_serial():
         
         reader_thread = threading.Thread(
             target=serial_reader,
-            args=(ser, data_queue, stop_event),
+            args=(ser, data_queue, data_available, stop_event),
             name="SerialReader"
         )
-        
+
         processor_thread = threading.Thread(
             target=packet_processor,
-            args=(ser, data_queue, stop_event, collector),
+            args=(ser, data_queue, data_available, stop_event, result_queue),
             name="PacketProcessor"
         )
-        
+
+        collector_thread = threading.Thread(
+            target=collector_worker,
+            args=(result_queue, stop_event, collector),
+            name="CollectorWorker"
+        )
+
         reader_thread.daemon = True
         processor_thread.daemon = True
-        
+        collector_thread.daemon = True
+
         reader_thread.start()
         processor_thread.start()
+        collector_thread.start()
         
         try:
             while True:
@@ -289,11 +381,17 @@ def monitor_serial():
                     elif cmd == 'r':
                         collector.save_raw_xml()
                     elif cmd == 'v':
-                        collector.visualize_matrices()
+                        # Plot a snapshot in a child process so rendering
+                        # never shares the GIL with the serial threads
+                        multiprocessing.Process(
+                            target=_visualize_worker,
+                            args=(dict(collector.devices),),
+                            daemon=True
+                        ).start()
                     elif cmd == 'q':
                         break
                 
-                if not reader_thread.is_alive() or not processor_thread.is_alive():
+                if not reader_thread.is_alive() or not processor_thread.is_alive() or not collector_thread.is_alive():
                     print("Thread died")
                     break
                     
@@ -307,11 +405,20 @@ def monitor_serial():
             # Wait for threads to finish (with timeout)
             reader_thread.join(timeout=2)
             processor_thread.join(timeout=2)
+            collector_thread.join(timeout=2)
             
             print("Monitor stopped")
 
 if __name__ == "__main__":
-    if len(sys.argv) > 1:
-        offline_mode(sys.argv[1])
+    import argparse
+    parser = argparse.ArgumentParser(description="Concurrent serial monitor")
+    parser.add_argument("xml_file", nargs="?",
+                        help="load raw data XML and enter offline mode")
+    parser.add_argument("--port", default=PORT, help="serial port")
+    parser.add_argument("--baudrate", type=int, default=BAUDRATE, help="baud rate")
+    args = parser.parse_args()
+
+    if args.xml_file:
+        offline_mode(args.xml_file)
     else:
-        monitor_serial()
\ No newline at end of file
+        monitor_serial(args.port, args.baudrate)
\ No newline at end of file
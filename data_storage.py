@@ -1,13 +1,19 @@
 #!/usr/bin/env python3
+import numpy as np
 import pandas as pd
 
 from event_decoder import decode_event_type_one_hot, PIN_EVENT_TYPES
 from pin_analyzer import analyze_all_pins, analyze_pin
 from phase_masking import PhaseMasking
 import base64
+import bisect
+import functools
+import os
 from datetime import datetime
 import sys
 
+from export_sha256 import export_sha256
+
 KEY_CHUNK_ID = 0
 KEY_PINS = 2
 KEY_PIN = 4
@@ -52,6 +58,26 @@ PHASE_NAMES = {
     5: "ALLPULLDOWN_HIGH"
 }
 
+# Event names that invalidate a pin for a given phase
+PHASE_ERROR_EVENTS = {
+    0: "PIN_IS_NOT_LOW_WHEN_ONE_SET_PULLDOWN",
+    1: "PIN_IS_NOT_HIGH_WHEN_ONE_SET_PULLUP",
+    2: "PIN_IS_NOT_LOW_WHEN_DRIVEN_LOW",
+    3: "PIN_IS_NOT_HIGH_WHEN_DRIVEN_HIGH",
+    4: "PIN_IS_NOT_LOW_WHEN_ALLPULLUP_LOW",
+    5: "PIN_IS_NOT_HIGH_WHEN_ALLPULLDOWN_HIGH"
+}
+
+# Same table as a bit in the pin's raw event mask, so the phase-matrix
+# builder can test one AND instead of scanning the decoded event list.
+# Names without a decoder bit map to 0: the test is then always false and
+# the pin counts as working, exactly like the old name-in-list check.
+_EVENT_NAME_BITS = {name: 1 << bit for bit, name in PIN_EVENT_TYPES.items()}
+_PHASE_ERROR_BITS = {
+    phase: _EVENT_NAME_BITS.get(name, 0)
+    for phase, name in PHASE_ERROR_EVENTS.items()
+}
+
 # Pin Name Mappings for NRF52840
 NRF52840_PIN_NAMES = {
     21: "GPIO0_UART_RX",
@@ -126,25 +152,34 @@ MSP430_PIN_NAMES = {
     59: "RTC_INT",    # P7.3
 }
 
+@functools.lru_cache(maxsize=None)
+def _get_family_pin_table(device_family):
+    """Resolve the pin-name table for a device family.
+
+    Memoized so the str().upper() classification runs once per family
+    instead of once per name/pin lookup.
+    """
+    family = str(device_family).upper()
+    if "NRF" in family:
+        return NRF52840_PIN_NAMES
+    if "MSP" in family:
+        return MSP430_PIN_NAMES
+    return {}
+
+@functools.lru_cache(maxsize=None)
 def get_pin_name(device_family, pin_num):
-    """Get the pin name for a given device family and pin number"""
-    if "NRF" in str(device_family).upper():
-        name = NRF52840_PIN_NAMES.get(pin_num)
-        return f"{pin_num}: {name}" if name else str(pin_num)
-    elif "MSP" in str(device_family).upper():
-        name = MSP430_PIN_NAMES.get(pin_num)
-        return f"{pin_num}: {name}" if name else str(pin_num)
-    else:
-        return str(pin_num)
+    """Get the pin name for a given device family and pin number.
 
+    Memoized: the matrix and report loops call this O(N^2) times with the
+    same handful of (family, pin) pairs, so repeats collapse to a dict hit.
+    """
+    name = _get_family_pin_table(device_family).get(pin_num)
+    return f"{pin_num}: {name}" if name else str(pin_num)
+
+@functools.lru_cache(maxsize=None)
 def get_known_pins(device_family):
-    """Get list of known pin numbers for a device family"""
-    if "NRF" in str(device_family).upper():
-        return list(NRF52840_PIN_NAMES.keys())
-    elif "MSP" in str(device_family).upper():
-        return list(MSP430_PIN_NAMES.keys())
-    else:
-        return []
+    """Get the known pin numbers for a device family as a frozenset"""
+    return frozenset(_get_family_pin_table(device_family))
 
 def get_all_pins_sorted(device_family, device_data):
     """Get all pins from device data sorted by pin number"""
@@ -162,11 +197,15 @@ class TeeOutput:
     def __init__(self, file_handle):
         self.terminal = sys.stdout
         self.log = file_handle
-    
+        # Bind the write methods once; write() runs for every print during
+        # report generation and the attribute walks add up there
+        self._term_write = self.terminal.write
+        self._log_write = file_handle.write
+
     def write(self, message):
-        self.terminal.write(message)
-        self.log.write(message)
-    
+        self._term_write(message)
+        self._log_write(message)
+
     def flush(self):
         self.terminal.flush()
         self.log.flush()
@@ -181,6 +220,30 @@ class DeviceDataCollector:
         self.output_file = None
         self.original_stdout = None
         self.capture_started = False
+        # Bumped on every mutation of device data so expensive derived
+        # results (e.g. connection analysis) can be cached against it
+        self.data_version = 0
+        # Per-family (pins, labels, pin->index) used by the matrix builders,
+        # keyed by data_version so ingest invalidates it
+        self._pin_index_cache = {}
+        # Device families in sorted order, maintained on insert so the
+        # report/visualization loops never re-sort the keys
+        self._sorted_families = []
+        # Families whose completion was seen but whose report has not been
+        # written yet; filled on the False -> True transition in
+        # process_chunk so is_complete need not rescan every device
+        self._pending_reports = []
+
+    def _ordered_families(self):
+        """Device families in sorted order.
+
+        Normally maintained incrementally by process_header; rebuilt here
+        when the devices dict was assigned directly, e.g. on the snapshot
+        handed to the visualization child process.
+        """
+        if len(self._sorted_families) != len(self.devices):
+            self._sorted_families = sorted(self.devices)
+        return self._sorted_families
 
 
     def _save_matrix(self, df, title=None, filename=None):
@@ -197,8 +260,10 @@ class DeviceDataCollector:
     
     def _save_heatmap(self, df, filename, cmap, xlabel, ylabel, annot=True, fmt='g', vmin=None, vmax=None, legend_handles=None, figsize=(12, 10)):
         import seaborn as sns
+        import matplotlib
+        matplotlib.use('Agg')  # heatmaps only go to PDF; never load a GUI backend
         import matplotlib.pyplot as plt
-        
+
         plt.figure(figsize=figsize)
         sns.heatmap(df, annot=annot, cmap=cmap, cbar=False, fmt=fmt, vmin=vmin, vmax=vmax)
         plt.xlabel(xlabel)
@@ -226,6 +291,9 @@ class DeviceDataCollector:
 
         self.current_device_family = device_family
 
+        if device_family not in self.devices:
+            bisect.insort(self._sorted_families, device_family)
+
         # Clear existing data for this device_family when new header received
         self.devices[device_family] = {
             'total_chunks': header_data.get(HEADER_KEY_TOTAL_CHUNKS, 0),
@@ -236,9 +304,11 @@ class DeviceDataCollector:
             'raw_session_chunks': {}, 
             'complete': False,
             'saved': False,
+            'external_peers': set(),
             'uuid': header_data.get(HEADER_KEY_DEVICE_UUID, "UNKNOWN"),
             'git_commit': git_commit_hash
         }
+        self.data_version += 1
         return True
     
     def process_chunk(self, chunk_result):
@@ -253,11 +323,15 @@ class DeviceDataCollector:
         chunk_id = chunk_data.get(KEY_CHUNK_ID, chunk_result.get('packet_id', -1))
         session_id = chunk_data.get(KEY_STREAM_NUMBER, 0)
         
+        # Received chunk ids are tracked as one int bitmask per session:
+        # duplicate detection is a single AND and completion a popcount,
+        # with no hash set per session
         if session_id not in device['received_sessions']:
-            device['received_sessions'][session_id] = set()
+            device['received_sessions'][session_id] = 0
             device['raw_session_chunks'][session_id] = {}
-            
-        if chunk_id in device['received_sessions'][session_id]:
+
+        chunk_bit = 1 << chunk_id
+        if device['received_sessions'][session_id] & chunk_bit:
             return False
         
         # Store raw chunk bytes
@@ -277,6 +351,12 @@ class DeviceDataCollector:
                                 KEY_CONNECTION_TYPE: c.get(KEY_CONNECTION_TYPE, 0)} 
                                for c in pin_entry.get(KEY_CONNECTIONS, [])]
 
+            # Remember which external devices this one actually reported
+            # connections to, so the cross-device matrix builder can skip
+            # scanning connections for pairs that never touched
+            for conn in new_connections:
+                if conn[KEY_CONNECTION_TYPE] == CONNECTION_TYPE_EXTERNAL:
+                    device['external_peers'].add(conn[KEY_CONNECTION_PARAMETER])
 
             strength = analyze_pin(events)
             # Find existing pin entry or create new one
@@ -298,19 +378,23 @@ class DeviceDataCollector:
                     'connections': new_connections
                 })
         
-        device['received_sessions'][session_id].add(chunk_id)
-        
+        device['received_sessions'][session_id] |= chunk_bit
+
         # Check completion: All expected sessions must have all chunks
         sessions_done = 0
         for s_id in range(device['expected_sessions']):
-            if s_id in device['received_sessions'] and len(device['received_sessions'][s_id]) == device['total_chunks']:
+            if s_id in device['received_sessions'] and device['received_sessions'][s_id].bit_count() == device['total_chunks']:
                 sessions_done += 1
         
+        was_complete = device['complete']
         device['complete'] = (sessions_done == device['expected_sessions'])
-        
+
         # Filter connections after all data is loaded
         if device['complete']:
             self._filter_weak_connections(self.current_device_family)
+            if not was_complete:
+                self._pending_reports.append(self.current_device_family)
+        self.data_version += 1
         return True
     
     def _filter_weak_connections(self, device_family):
@@ -319,27 +403,34 @@ class DeviceDataCollector:
         if not device:
             return
         
-        # Create mapping of pin number to events
-        pin_events = {pin['pin']: pin['events'] for pin in device['pins']}
-        
+        # Resolve each pin's strength once up front and collapse it into a
+        # bitmask of the phases that pin masks (strength >= 1 masks phases
+        # 1 and 3, strength <= -1 masks phases 0 and 2); the per-connection
+        # check then degenerates to one OR and one bit test
+        pin_phase_mask = {}
+        for pin in device['pins']:
+            strength = pin.get('strength')
+            if strength is None:
+                strength = analyze_pin(pin.get('events', []))
+            if strength is None or strength == 0:
+                mask = 0
+            elif strength >= 1:
+                mask = (1 << 1) | (1 << 3)
+            else:
+                mask = (1 << 0) | (1 << 2)
+            pin_phase_mask[pin['pin']] = mask
+
         # Filter connections for each pin
         for pin in device['pins']:
+            source_mask = pin_phase_mask[pin['pin']]
             for conn in pin['connections']:
                 conn_type = conn.get(KEY_CONNECTION_TYPE, 0)
                 if conn_type == CONNECTION_TYPE_INTERNAL:
                     phase = conn.get(KEY_CONNECTION_PARAMETER, -1)
-                    other_pin = conn.get(KEY_OTHER_PIN)
-                    
-                    # Check if source or target pin should be masked
-                    source_masked = self._should_mask_connection(pin['events'], phase)
-                    target_events = pin_events.get(other_pin, [])
-                    target_masked = self._should_mask_connection(target_events, phase)
-                    
-                    # Mark connection if either is masked
-                    if source_masked or target_masked:
-                        conn['masked'] = True
-                    else:
-                        conn['masked'] = False
+                    combined = source_mask | pin_phase_mask.get(conn.get(KEY_OTHER_PIN), 0)
+
+                    # Mark connection if either endpoint masks this phase
+                    conn['masked'] = phase >= 0 and bool((combined >> phase) & 1)
                 else:
                     conn['masked'] = False
 
@@ -360,15 +451,16 @@ class DeviceDataCollector:
                     if 0 <= phase <= 5:
                         pin_pair = (pin['pin'], conn.get(KEY_OTHER_PIN))
                         if pin_pair not in connection_pairs:
-                            connection_pairs[pin_pair] = {'phases': set(), 'connections': []}
-                        connection_pairs[pin_pair]['phases'].add(phase)
+                            connection_pairs[pin_pair] = {'phase_mask': 0, 'connections': []}
+                        connection_pairs[pin_pair]['phase_mask'] |= 1 << phase
                         connection_pairs[pin_pair]['connections'].append(conn)
-        
+
         # Second pass: apply masking
         for pair_data in connection_pairs.values():
+            phase_mask = pair_data['phase_mask']
             for conn in pair_data['connections']:
                 phase = conn.get(KEY_CONNECTION_PARAMETER, -1)
-                conn['phase_masked'] = not PhaseMasking.should_keep_phase(phase, pair_data['phases'])
+                conn['phase_masked'] = not PhaseMasking.should_keep_phase_mask(phase, phase_mask)
     
     def get_all_devices(self):
         return self.devices
@@ -385,13 +477,14 @@ class DeviceDataCollector:
             else:
                 device_uuid = "UNKNOWN"
         
-        import os
         os.makedirs("logs", exist_ok=True)
         
         timestamp = datetime.now().strftime("%Y_%m_%d_%H_%M_%S")
         filename = f"logs/output_{device_family}_{device_uuid}_{timestamp}.txt"
         
-        self.output_file = open(filename, 'w', encoding='utf-8')
+        # Large buffer so the log half of the tee batches its syscalls;
+        # the file is flushed/closed when capture stops anyway
+        self.output_file = open(filename, 'w', encoding='utf-8', buffering=1 << 16)
         print(f"Saving to: {filename}")
         
         self.original_stdout = sys.stdout
@@ -421,7 +514,7 @@ class DeviceDataCollector:
         # --- Collect all matrix and force analysis binary data ---
         combined_bytes = bytearray()
         # External connection matrices
-        for other_device in sorted(self.devices.keys()):
+        for other_device in self._ordered_families():
             if device_family != other_device:
                 df = self.create_connection_matrix(device_family, other_device)
                 if df is not None:
@@ -440,13 +533,12 @@ class DeviceDataCollector:
                 strength = analyze_pin(events)
             strengths.append(strength)
         
-        from export_sha256 import export_sha256
         sha256_hash = export_sha256([device])
         print(f"HASH: {sha256_hash}")
 
         # Print connections summary (filtered for this device)
-        print("\n=== Pin Connections ===")
-        print(f"Device {device_family}:")
+        # Collect all lines and write once instead of one print per connection
+        lines = ["\n=== Pin Connections ===", f"Device {device_family}:"]
         for pin in device['pins']:
             pin_name = get_pin_name(device_family, pin['pin'])
             for conn in pin['connections']:
@@ -458,13 +550,14 @@ class DeviceDataCollector:
 
                 if conn_type == CONNECTION_TYPE_INTERNAL:
                     phase_name = PHASE_NAMES.get(param, f"PHASE_{param}")
-                    print(f"  {pin_name} -> {other_pin_name} [{phase_name}]")
+                    lines.append(f"  {pin_name} -> {other_pin_name} [{phase_name}]")
                 else:  # EXTERNAL
-                    print(f"  {pin_name} -> Device{param}:{other_pin_name} [EXT]")
-        print("="*23 + "\n")
+                    lines.append(f"  {pin_name} -> Device{param}:{other_pin_name} [EXT]")
+        lines.append("="*23 + "\n")
+        print("\n".join(lines))
 
         # External connection matrices (to other devices)
-        for other_device in sorted(self.devices.keys()):
+        for other_device in self._ordered_families():
             if device_family != other_device:
                 self.print_connection_matrix(device_family, other_device)
 
@@ -478,12 +571,16 @@ class DeviceDataCollector:
         self._stop_output_capture()
 
     def is_complete(self):
-        # Check for any completed but unsaved devices
-        for family, device in self.devices.items():
-            if device['complete'] and not device.get('saved', False):
+        # Save any device that completed since the last check; the queue is
+        # filled by process_chunk so this is O(1) when nothing is pending
+        # instead of a scan over all devices per call
+        while self._pending_reports:
+            family = self._pending_reports.pop(0)
+            device = self.devices.get(family)
+            if device and device['complete'] and not device.get('saved', False):
                 self.save_device_report(family)
                 device['saved'] = True
-        
+
         return False
         
     
@@ -495,7 +592,6 @@ class DeviceDataCollector:
         self._start_output_capture("ALL", "DEVICES")
         print(f"Manual save")
         self.print_connections_summary()
-        from export_sha256 import export_sha256
         sha256_hash = export_sha256([self.devices.get(self.current_device_family)])
         device = self.devices.get(self.current_device_family)
         version = device.get('git_commit', 'UNKNOWN') if device else 'UNKNOWN'
@@ -504,51 +600,54 @@ class DeviceDataCollector:
         meta = f"SHA256: {sha256_hash}\nVersion: {version}\nUUID: {uuid}\nDevice Family: {family}\n"
         if self.output_file:
             self.output_file.write(meta)
-        for device_family in sorted(self.devices.keys()):
-            for other_device in sorted(self.devices.keys()):
+        for device_family in self._ordered_families():
+            for other_device in self._ordered_families():
                 if device_family != other_device:
                     self.print_connection_matrix(device_family, other_device)
             self.print_all_phase_matrices(device_family)
-        print("\n=== All Connections After Masking ===")
-        for device_family, device_data in sorted(self.devices.items()):
-            print(f"Device {device_family}:")
+        # Collect all lines and write once instead of one print per connection
+        lines = ["\n=== All Connections After Masking ==="]
+        for device_family, device_data in ((f, self.devices[f]) for f in self._ordered_families()):
+            lines.append(f"Device {device_family}:")
             for pin in device_data['pins']:
                 pin_name = get_pin_name(device_family, pin['pin'])
                 for conn in pin['connections']:
                     other_pin_name = get_pin_name(device_family, conn.get(KEY_OTHER_PIN))
-                    
+
                     strength = pin.get('strength')
                     if strength is None:
                         strength = analyze_pin(pin.get('events', []))
-                    
+
                     strength_masked = self._should_mask_connection(pin['events'], conn.get(KEY_CONNECTION_PARAMETER), strength)
                     masked = conn.get('masked', False)
                     phase_masked = conn.get('phase_masked', False)
-                    
+
                     if not (masked or phase_masked or strength_masked):
                         conn_type = conn.get(KEY_CONNECTION_TYPE, 0)
                         param = conn.get(KEY_CONNECTION_PARAMETER, 0)
                         if conn_type == CONNECTION_TYPE_INTERNAL:
                             phase_name = PHASE_NAMES.get(param, f"PHASE_{param}")
-                            print(f"  {pin_name} -> {other_pin_name} [{phase_name}]")
+                            lines.append(f"  {pin_name} -> {other_pin_name} [{phase_name}]")
                         else:
-                            print(f"  {pin_name} -> Device{param}:{other_pin_name} [EXT]")
-            print("="*23 + "\n")
+                            lines.append(f"  {pin_name} -> Device{param}:{other_pin_name} [EXT]")
+            lines.append("="*23 + "\n")
+        print("\n".join(lines))
         self.run_pin_analysis()
         self._stop_output_capture()
     
     
     def print_connections_summary(self):
-        print("\n=== Pin Connections ===")
-        for device_family, device_data in sorted(self.devices.items()):
-            print(f"Device {device_family}:")
+        # Collect all lines and write once instead of one print per connection
+        lines = ["\n=== Pin Connections ==="]
+        for device_family, device_data in ((f, self.devices[f]) for f in self._ordered_families()):
+            lines.append(f"Device {device_family}:")
             for pin in device_data['pins']:
                 pin_name = get_pin_name(device_family, pin['pin'])
                 for conn in pin['connections']:
                     strength = pin.get('strength')
                     if strength is None:
                         strength = analyze_pin(pin.get('events', []))
-                        
+
                     if self._should_mask_connection(pin['events'], conn.get(KEY_CONNECTION_PARAMETER), strength) or conn.get('masked', False) or conn.get('phase_masked', False):
                         continue
                     conn_type = conn.get(KEY_CONNECTION_TYPE, 0)
@@ -556,38 +655,41 @@ class DeviceDataCollector:
                     other_pin_name = get_pin_name(device_family, conn.get(KEY_OTHER_PIN))
                     if conn_type == CONNECTION_TYPE_INTERNAL:
                         phase_name = PHASE_NAMES.get(param, f"PHASE_{param}")
-                        print(f"  {pin_name} -> {other_pin_name} [{phase_name}]")
+                        lines.append(f"  {pin_name} -> {other_pin_name} [{phase_name}]")
                     else:  # EXTERNAL
-                        print(f"  {pin_name} -> Device{param}:{other_pin_name} [EXT]")
-        print("="*23 + "\n")
+                        lines.append(f"  {pin_name} -> Device{param}:{other_pin_name} [EXT]")
+        lines.append("="*23 + "\n")
+        print("\n".join(lines))
 
     def print_all_pin_events(self, device_family=None):
         """Print decoded events for all pins for all devices or a specific one."""
-        print("\n=== Pin Events ===")
-        
-        devices_to_print = [device_family] if device_family is not None else sorted(self.devices.keys())
-        
+        # Collect all lines and write once instead of one print per pin
+        lines = ["\n=== Pin Events ==="]
+
+        devices_to_print = [device_family] if device_family is not None else self._ordered_families()
+
         for family in devices_to_print:
             if family not in self.devices:
                 continue
-                
+
             device_data = self.devices[family]
-            print(f"Device {family}:")
+            lines.append(f"Device {family}:")
             for pin in device_data['pins']:
                 pin_name = get_pin_name(family, pin['pin'])
                 events = pin.get('events', [])
                 mask = pin.get('events_mask', 0)
                 if events:
-                    print(f"  {pin_name}: {', '.join(events)} (Mask: {mask})")
+                    lines.append(f"  {pin_name}: {', '.join(events)} (Mask: {mask})")
                     if "EXCEEDS_CONNECTION_LIMIT" in events:
-                        print(f"  WARNING: Connection limit exceeded for this pin!")
+                        lines.append(f"  WARNING: Connection limit exceeded for this pin!")
                 else:
-                    print(f"  {pin_name}: No events (Mask: {mask})")
-        print("="*23 + "\n")
+                    lines.append(f"  {pin_name}: No events (Mask: {mask})")
+        lines.append("="*23 + "\n")
+        print("\n".join(lines))
     
     def run_pin_analysis(self, device_family=None, precalculated_strengths=None):
         """Run pin force analysis for all devices or a specific one."""
-        devices_to_analyze = [device_family] if device_family is not None else sorted(self.devices.keys())
+        devices_to_analyze = [device_family] if device_family is not None else self._ordered_families()
         for family in devices_to_analyze:
             if family not in self.devices:
                 continue
@@ -607,30 +709,24 @@ class DeviceDataCollector:
                         strength = analyze_pin(events)
                     strengths.append(strength)
             
-            print(f"\n{'='*80}")
-            print(f"Pin Force Analysis - Device {family}")
-            print(f"{'='*80}")
+            # Collect all lines and write once instead of one print per pin
+            lines = [f"\n{'='*80}",
+                     f"Pin Force Analysis - Device {family}",
+                     f"{'='*80}"]
             for pin_data, strength in zip(device_data['pins'], strengths):
                 pin_num = pin_data.get('pin', 'UNKNOWN')
                 pin_name = get_pin_name(family, pin_num)
                 if strength is not None:
-                    print(f"  {pin_name}: {strength}")
+                    lines.append(f"  {pin_name}: {strength}")
                 else:
-                    print(f"  {pin_name}: Undefined")
-            print(f"{'='*80}\n")
+                    lines.append(f"  {pin_name}: Undefined")
+            lines.append(f"{'='*80}\n")
+            print("\n".join(lines))
     
     
-    def _should_mask_connection(self, events, phase, strength=None):
-        # Use stored strength if available, otherwise calculate
-        if strength is None:
-            for pin in self.devices[self.current_device_family]['pins']:
-                if pin['events'] == events:
-                    strength = pin.get('strength')
-                    break
-        
-        if strength is None:
-            strength = analyze_pin(events)
-            
+    @staticmethod
+    def _strength_masks_phase(strength, phase):
+        """Return True if a pin with the given strength masks the phase"""
         if strength is None or strength == 0:
             return False
         # Mask pins with strength >= 1 in phases 1 and 3
@@ -640,29 +736,59 @@ class DeviceDataCollector:
         if strength <= -1 and phase in (0, 2):
             return True
         return False
+
+    def _should_mask_connection(self, events, phase, strength=None):
+        # Use stored strength if available, otherwise calculate
+        if strength is None:
+            for pin in self.devices[self.current_device_family]['pins']:
+                if pin['events'] == events:
+                    strength = pin.get('strength')
+                    break
+
+        if strength is None:
+            strength = analyze_pin(events)
+
+        return self._strength_masks_phase(strength, phase)
     
+    def _get_pin_matrix_index(self, device_family):
+        """Pin numbers, display labels and pin->row index for a device.
+
+        Rebuilt only when device data has changed; the matrix builders call
+        this once per matrix instead of recreating the lists each time.
+        """
+        cached = self._pin_index_cache.get(device_family)
+        if cached is not None and cached[0] == self.data_version:
+            return cached[1], cached[2], cached[3]
+        pins = [pin['pin'] for pin in self.devices[device_family]['pins']]
+        labels = [get_pin_name(device_family, pin) for pin in pins]
+        pin_index = {pin: i for i, pin in enumerate(pins)}
+        self._pin_index_cache[device_family] = (self.data_version, pins, labels, pin_index)
+        return pins, labels, pin_index
+
     def create_connection_matrix(self, controller_a, controller_b):
         if controller_a not in self.devices or controller_b not in self.devices:
             print(f"Controller {controller_a} or {controller_b} not found")
             return None
         device_a = self.devices[controller_a]
-        device_b = self.devices[controller_b]
-        pins_a = [pin['pin'] for pin in device_a['pins']]
-        pins_b = [pin['pin'] for pin in device_b['pins']]
-        row_labels = [get_pin_name(controller_a, pin) for pin in pins_a]
-        col_labels = [get_pin_name(controller_b, pin) for pin in pins_b]
-        df = pd.DataFrame(0, index=row_labels, columns=col_labels)
-        for pin in device_a['pins']:
-            pin_name_a = get_pin_name(controller_a, pin['pin'])
-            for conn in pin['connections']:
-                conn_type = conn.get(KEY_CONNECTION_TYPE, 0)
-                if conn_type == CONNECTION_TYPE_EXTERNAL:
-                    device_id = conn.get(KEY_CONNECTION_PARAMETER, -1)
-                    if device_id == controller_b:
-                        pin_name_b = get_pin_name(controller_b, conn.get(KEY_OTHER_PIN))
-                        if pin_name_b in col_labels:
-                            df.at[pin_name_a, pin_name_b] = 1
-        return df
+        pins_a, row_labels, _ = self._get_pin_matrix_index(controller_a)
+        pins_b, col_labels, col_index = self._get_pin_matrix_index(controller_b)
+
+        # Scatter into a compact numpy array by index - O(#connections)
+        # instead of O(N^2) per-cell DataFrame .at assignments. Pairs with
+        # no reported connections (the common case with several devices)
+        # keep the all-zeros matrix without walking any connection list.
+        matrix = np.zeros((len(pins_a), len(pins_b)), dtype=np.uint8)
+        if controller_b in device_a.get('external_peers', ()):
+            for i, pin in enumerate(device_a['pins']):
+                for conn in pin['connections']:
+                    conn_type = conn.get(KEY_CONNECTION_TYPE, 0)
+                    if conn_type == CONNECTION_TYPE_EXTERNAL:
+                        device_id = conn.get(KEY_CONNECTION_PARAMETER, -1)
+                        if device_id == controller_b:
+                            j = col_index.get(conn.get(KEY_OTHER_PIN))
+                            if j is not None:
+                                matrix[i, j] = 1
+        return pd.DataFrame(matrix, index=row_labels, columns=col_labels)
     
     def print_connection_matrix(self, controller_a, controller_b, filename=None):
         df = self.create_connection_matrix(controller_a, controller_b)
@@ -678,36 +804,29 @@ class DeviceDataCollector:
             print(f"Invalid phase {phase}. Must be between 0 and 5")
             return None
         device = self.devices[controller]
-        pins = [pin['pin'] for pin in device['pins']]
-        labels = [get_pin_name(controller, pin) for pin in pins]
-        df = pd.DataFrame(0, index=labels, columns=labels)
-        phase_error_events = {
-            0: "PIN_IS_NOT_LOW_WHEN_ONE_SET_PULLDOWN",
-            1: "PIN_IS_NOT_HIGH_WHEN_ONE_SET_PULLUP",
-            2: "PIN_IS_NOT_LOW_WHEN_DRIVEN_LOW",
-            3: "PIN_IS_NOT_HIGH_WHEN_DRIVEN_HIGH",
-            4: "PIN_IS_NOT_LOW_WHEN_ALLPULLUP_LOW",
-            5: "PIN_IS_NOT_HIGH_WHEN_ALLPULLDOWN_HIGH"
-        }
-        for pin in device['pins']:
-            pin_name_a = get_pin_name(controller, pin['pin'])
-            error_event = phase_error_events.get(phase)
-            pin_works = error_event and error_event not in pin['events']
-            
+        pins, labels, pin_index = self._get_pin_matrix_index(controller)
+        error_bit = _PHASE_ERROR_BITS[phase]
+
+        # Scatter into a compact numpy array by index - O(#connections)
+        # instead of O(N^2) per-cell DataFrame .at assignments
+        matrix = np.zeros((len(pins), len(pins)), dtype=np.uint8)
+        for i, pin in enumerate(device['pins']):
+            pin_works = not (pin.get('events_mask', 0) & error_bit)
+            if not pin_works:
+                # A broken pin never sets any cell; skip its connections
+                continue
+
             # Diagonal elements (self-check) are never masked
-            if pin_works:
-                df.at[pin_name_a, pin_name_a] = 1
+            matrix[i, i] = 1
 
             for conn in pin['connections']:
                 conn_type = conn.get(KEY_CONNECTION_TYPE, 0)
                 if conn_type == CONNECTION_TYPE_INTERNAL:
-                    conn_phase = conn.get(KEY_CONNECTION_PARAMETER, -1)
-                    pin_name_b = get_pin_name(controller, conn.get(KEY_OTHER_PIN))
-                                        
-                    if conn_phase == phase and pin_name_b in labels:
-                        if pin_works:
-                            df.at[pin_name_a, pin_name_b] = 1
-        return df
+                    if conn.get(KEY_CONNECTION_PARAMETER, -1) == phase:
+                        j = pin_index.get(conn.get(KEY_OTHER_PIN))
+                        if j is not None:
+                            matrix[i, j] = 1
+        return pd.DataFrame(matrix, index=labels, columns=labels)
 
     def print_phase_matrix(self, controller, phase, filename=None):
         df = self.create_phase_matrix(controller, phase)
@@ -722,58 +841,55 @@ class DeviceDataCollector:
 
     def save_raw_xml(self):
         """Save all collected data to an XML file with metadata (per device CBOR base64)"""
-        import xml.etree.ElementTree as ET
         import socket
-        import os
+        from xml.sax.saxutils import escape, quoteattr
         os.makedirs("raw_data", exist_ok=True)
-        root = ET.Element("ShepperdTest")
-        meta = ET.SubElement(root, "Metadata")
-        ET.SubElement(meta, "Timestamp").text = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        ET.SubElement(meta, "Computer").text = socket.gethostname()
+
+        timestamp = datetime.now().strftime("%Y_%m_%d_%H_%M_%S")
+        filename = f"raw_data/raw_data_{timestamp}.xml"
         try:
-            ET.SubElement(meta, "User").text = os.getlogin()
-        except:
-            ET.SubElement(meta, "User").text = "unknown"
-        devices_elem = ET.SubElement(root, "Devices")
-        for family, device_data in self.devices.items():
-            dev_elem = ET.SubElement(devices_elem, "Device")
-            dev_elem.set("Family", str(family))
-            dev_elem.set("UUID", str(device_data.get('uuid', 'UNKNOWN')))
-            dev_elem.set("GitCommit", str(device_data.get('git_commit', 'UNKNOWN')))
-
-            # Global packet ID counter for this device
-            packet_id = 0
-
-            # Header
-            if 'raw_header' in device_data and device_data['raw_header']:
-                header_elem = ET.SubElement(dev_elem, "RawData")
-                header_elem.set("Type", "Header")
-                header_elem.set("Session", "0")
-                header_elem.set("Id", str(packet_id))
-                header_elem.set("Encoding", "base64")
-                header_elem.text = base64.b64encode(device_data['raw_header']).decode('utf-8')
-                packet_id += 1
-            
-            # Chunks
-            if 'raw_session_chunks' in device_data:
-                for session_id in sorted(device_data['raw_session_chunks'].keys()):
+            user = os.getlogin()
+        except Exception:
+            user = "unknown"
+
+        # Stream the document straight to disk instead of building an
+        # ElementTree first: the base64 payloads dominate the file size and
+        # the tree (plus the ET.indent walk) held a second copy of them all
+        with open(filename, 'w', encoding='utf-8', buffering=1 << 16) as f:
+            f.write("<?xml version='1.0' encoding='utf-8'?>\n")
+            f.write("<ShepperdTest>\n")
+            f.write("  <Metadata>\n")
+            f.write(f"    <Timestamp>{escape(datetime.now().strftime('%Y-%m-%d %H:%M:%S'))}</Timestamp>\n")
+            f.write(f"    <Computer>{escape(socket.gethostname())}</Computer>\n")
+            f.write(f"    <User>{escape(user)}</User>\n")
+            f.write("  </Metadata>\n")
+            f.write("  <Devices>\n")
+            for family, device_data in self.devices.items():
+                f.write(f"    <Device Family={quoteattr(str(family))}"
+                        f" UUID={quoteattr(str(device_data.get('uuid', 'UNKNOWN')))}"
+                        f" GitCommit={quoteattr(str(device_data.get('git_commit', 'UNKNOWN')))}>\n")
+
+                # Global packet ID counter for this device
+                packet_id = 0
+
+                # Header
+                if device_data.get('raw_header'):
+                    payload = base64.b64encode(device_data['raw_header']).decode('ascii')
+                    f.write(f'      <RawData Type="Header" Session="0" Id="{packet_id}"'
+                            f' Encoding="base64">{payload}</RawData>\n')
+                    packet_id += 1
+
+                # Chunks
+                for session_id in sorted(device_data.get('raw_session_chunks', {})):
                     chunks = device_data['raw_session_chunks'][session_id]
                     for chunk_id in sorted(chunks.keys()):
-                        chunk_elem = ET.SubElement(dev_elem, "RawData")
-                        chunk_elem.set("Type", "Chunk")
-                        chunk_elem.set("Session", str(session_id))
-                        chunk_elem.set("Id", str(packet_id))
-                        chunk_elem.set("ChunkId", str(chunk_id))
-                        chunk_elem.set("Encoding", "base64")
-                        chunk_elem.text = base64.b64encode(chunks[chunk_id]).decode('utf-8')
+                        payload = base64.b64encode(chunks[chunk_id]).decode('ascii')
+                        f.write(f'      <RawData Type="Chunk" Session="{session_id}" Id="{packet_id}"'
+                                f' ChunkId="{chunk_id}" Encoding="base64">{payload}</RawData>\n')
                         packet_id += 1
-
-        timestamp = datetime.now().strftime("%Y_%m_%d_%H_%M_%S")
-        filename = f"raw_data/raw_data_{timestamp}.xml"
-        if hasattr(ET, 'indent'):
-            ET.indent(root, space="  ", level=0)
-        tree = ET.ElementTree(root)
-        tree.write(filename, encoding="utf-8", xml_declaration=True)
+                f.write("    </Device>\n")
+            f.write("  </Devices>\n")
+            f.write("</ShepperdTest>\n")
         print(f"Raw XML saved to: {filename}")
 
     def visualize_matrices(self):
@@ -787,19 +903,18 @@ class DeviceDataCollector:
             print("Visualization requires seaborn and matplotlib. Please install them: pip install seaborn matplotlib")
             return
 
-        import os
         timestamp = datetime.now().strftime("%Y_%m_%d_%H_%M_%S")
         base_dir = f"visualization/viz_{timestamp}"
         os.makedirs(base_dir, exist_ok=True)
         print(f"Generating visualizations in: {base_dir}")
 
         # Apply phase masking before visualization
-        for device_family in sorted(self.devices.keys()):
+        for device_family in self._ordered_families():
             self._apply_phase_masking(device_family)
 
-        for device_family in sorted(self.devices.keys()):
+        for device_family in self._ordered_families():
             # External connection matrices
-            for other_device in sorted(self.devices.keys()):
+            for other_device in self._ordered_families():
                 if device_family != other_device:
                     df = self.create_connection_matrix(device_family, other_device)
                     if df is not None and not df.empty:
@@ -957,6 +1072,9 @@ class DeviceDataCollector:
         # Reset current state
         self.devices = {}
         self.current_device_family = None
+        self._sorted_families = []
+        self._pending_reports = []
+        self.data_version += 1
         
         devices_elem = root.find("Devices")
         if devices_elem is None:
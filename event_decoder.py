@@ -37,10 +37,14 @@ def decode_event_type_one_hot(event_bits):
     """Return list of event names for bits set in event_bits.
     """
     events = []
-    for bit_position in range(32):
-        if event_bits & (1 << bit_position):
-            event_name = PIN_EVENT_TYPES.get(bit_position, f"UNKNOWN_EVENT_{bit_position}")
-            events.append(event_name)
+    # Walk only the set bits (usually just a handful) instead of testing
+    # all 32 positions; event masks are 32 bit on the device side
+    event_bits &= 0xFFFFFFFF
+    while event_bits:
+        low_bit = event_bits & -event_bits
+        bit_position = low_bit.bit_length() - 1
+        events.append(PIN_EVENT_TYPES.get(bit_position, f"UNKNOWN_EVENT_{bit_position}"))
+        event_bits ^= low_bit
     return events
 
 def encode_event_list(events):
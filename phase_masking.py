@@ -5,49 +5,64 @@ Phase Masking - Centralized phase filtering logic for connections and matrices
 
 class PhaseMasking:
     """Class to handle phase masking/filtering logic for connections and matrices"""
-    
+
     MASK_VALUE = 3  # Value to use for masked phases
-    
+
+    # Bitmask of other phases that must be present for a phase to be kept,
+    # indexed by phase. Encodes the filtering rules:
+    #   phase 0 requires phases 2 and 4, phase 1 requires phases 3 and 5,
+    #   phase 2 requires phase 4, phase 3 requires phase 5,
+    #   phases 4 and 5 are always kept.
+    _PHASE_REQUIRES = (
+        (1 << 2) | (1 << 4),  # phase 0
+        (1 << 3) | (1 << 5),  # phase 1
+        1 << 4,               # phase 2
+        1 << 5,               # phase 3
+        0,                    # phase 4
+        0,                    # phase 5
+    )
+
+    @staticmethod
+    def phases_to_mask(existing_phases):
+        """Pack an iterable of phases (0-5) into a bitmask int"""
+        mask = 0
+        for phase in existing_phases:
+            mask |= 1 << phase
+        return mask
+
+    @staticmethod
+    def should_keep_phase_mask(phase, phase_mask):
+        """Apply phase filtering rules against a precomputed phase bitmask.
+
+        This is the hot-path variant: one table index and one AND instead of
+        multiple set membership tests.
+        """
+        required = PhaseMasking._PHASE_REQUIRES[phase]
+        return (phase_mask & required) == required
+
     @staticmethod
     def should_keep_phase(phase, existing_phases):
         """Apply phase filtering rules based on existing phases"""
-        # If phase 4 does not exist, remove phases 2 and 0
-        if 4 not in existing_phases:
-            if phase in (2, 0):
-                return False
-        
-        # If phase 5 does not exist, remove phases 3 and 1
-        if 5 not in existing_phases:
-            if phase in (3, 1):
-                return False
-        
-        # If phase 2 does not exist, remove phase 0
-        if 2 not in existing_phases:
-            if phase == 0:
-                return False
-        
-        # If phase 3 does not exist, remove phase 1
-        if 3 not in existing_phases:
-            if phase == 1:
-                return False
-        
-        return True
-    
+        return PhaseMasking.should_keep_phase_mask(
+            phase, PhaseMasking.phases_to_mask(existing_phases))
+
     @staticmethod
     def mask_matrix_values(matrix_data, existing_phases):
         """Mask matrix values based on phase filtering rules"""
         masked_matrix = matrix_data.copy()
-        
+        phase_mask = PhaseMasking.phases_to_mask(existing_phases)
+
         for phase in range(6):  # Phases 0-5
-            if not PhaseMasking.should_keep_phase(phase, existing_phases):
+            if not PhaseMasking.should_keep_phase_mask(phase, phase_mask):
                 # Set masked phase values to MASK_VALUE
                 if phase in masked_matrix:
                     masked_matrix[phase] = PhaseMasking.MASK_VALUE
-        
+
         return masked_matrix
-    
+
     @staticmethod
     def get_filtered_phases(all_phases):
         """Get list of phases that should be kept after filtering"""
-        return [phase for phase in all_phases 
-                if PhaseMasking.should_keep_phase(phase, set(all_phases))]
\ No newline at end of file
+        phase_mask = PhaseMasking.phases_to_mask(all_phases)
+        return [phase for phase in all_phases
+                if PhaseMasking.should_keep_phase_mask(phase, phase_mask)]
\ No newline at end of file